@@ -1,7 +1,10 @@
 import os
 import logging
+import orjson
 from flask import Flask
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
@@ -13,8 +16,19 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider encoding responses with orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Create the app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
@@ -23,8 +37,22 @@ app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:/
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
+    "query_cache_size": 1200,
 }
 
+# In-memory SQLite runs on a StaticPool, which has no size to configure
+database_url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+in_memory_sqlite = database_url.get_backend_name() == "sqlite" and (
+    database_url.database in (None, "", ":memory:")
+    or database_url.query.get("mode") == "memory"
+)
+if not in_memory_sqlite:
+    # Room for the parallel library scan workers next to request threads
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"].update({
+        "pool_size": 10,
+        "max_overflow": 20,
+    })
+
 # Initialize the app with the extension
 db.init_app(app)
 
@@ -32,6 +60,11 @@ with app.app_context():
     # Import models to ensure tables are created
     import models  # noqa: F401
     db.create_all()
+    
+    # create_all skips indexes of tables that already exist
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
 
 # Import routes after app creation
 from routes import *  # noqa: F401, F403
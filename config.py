@@ -1,9 +1,14 @@
-
 import os, pytz
+from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def get_tz(name):
+    """Resolve an IANA timezone name, caching the loaded zone"""
+    return pytz.timezone(name)
 
 tz_name = os.getenv("TZ", "UTC")
 
 try:
-    TZ = pytz.timezone(tz_name)
+    TZ = get_tz(tz_name)
 except pytz.UnknownTimeZoneError:
     TZ = pytz.UTC
\ No newline at end of file
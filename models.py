@@ -2,6 +2,10 @@ from datetime import datetime
 from app import db
 from config import TZ
 
+def now_tz():
+    """Current time in the configured timezone, used as column default"""
+    return datetime.now(tz=TZ)
+
 class LibraryConfig(db.Model):
     """Configuration for each Plex library"""
     __tablename__ = 'library_configs'
@@ -12,11 +16,11 @@ class LibraryConfig(db.Model):
     library_type = db.Column(db.String(50), nullable=False)  # movie, show, artist
     agent_name = db.Column(db.String(100), nullable=False)
     enabled = db.Column(db.Boolean, default=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=lambda: datetime.now(tz=TZ))
-    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(tz=TZ), onupdate=lambda: datetime.now(tz=TZ))
+    created_at = db.Column(db.DateTime, default=now_tz)
+    updated_at = db.Column(db.DateTime, default=now_tz, onupdate=now_tz)
     
     # Relationship to media items
-    media_items = db.relationship('MediaItem', backref='library_config', lazy=True, cascade='all, delete-orphan')
+    media_items = db.relationship('MediaItem', backref='library_config', lazy='raise', cascade='all, delete-orphan')
 
 class MediaItem(db.Model):
     """Tracks media items that have been processed"""
@@ -28,19 +32,22 @@ class MediaItem(db.Model):
     title = db.Column(db.String(500), nullable=False)
     media_type = db.Column(db.String(50), nullable=False)
     added_at = db.Column(db.DateTime, nullable=False)
-    processed_at = db.Column(db.DateTime, default=lambda: datetime.now(tz=TZ))
+    processed_at = db.Column(db.DateTime, default=now_tz)
     agent_matched = db.Column(db.String(100))
     match_successful = db.Column(db.Boolean, default=False)
     error_message = db.Column(db.Text)
     
-    __table_args__ = (db.UniqueConstraint('library_config_id', 'plex_key', name='_library_media_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('library_config_id', 'plex_key', name='_library_media_uc'),
+        db.Index('ix_media_items_cfg_processed', 'library_config_id', processed_at.desc()),
+    )
 
 class ScanLog(db.Model):
     """Logs of scanning operations"""
     __tablename__ = 'scan_logs'
     
     id = db.Column(db.Integer, primary_key=True)
-    scan_started_at = db.Column(db.DateTime, default=lambda: datetime.now(tz=TZ))
+    scan_started_at = db.Column(db.DateTime, default=now_tz)
     scan_completed_at = db.Column(db.DateTime)
     total_libraries = db.Column(db.Integer, default=0)
     total_media_found = db.Column(db.Integer, default=0)
@@ -48,3 +55,5 @@ class ScanLog(db.Model):
     total_errors = db.Column(db.Integer, default=0)
     status = db.Column(db.String(50), default='running')  # running, completed, failed
     error_message = db.Column(db.Text)
+    
+    __table_args__ = (db.Index('ix_scan_logs_started_desc', scan_started_at.desc()),)
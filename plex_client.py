@@ -1,36 +1,73 @@
 import os
+import time
 import logging
-import pytz
+import threading
 import requests
-import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree
 from datetime import datetime, timedelta
-from urllib.parse import urljoin
-from config import TZ
+from config import TZ, get_tz
 
 logger = logging.getLogger(__name__)
 
+# Number of items requested per page when listing library content
+CONTAINER_SIZE = 500
+
+# Compiled XPath expressions for elements read from Plex responses
+_SETTING_XPATH = etree.XPath('.//Setting')
+_DIRECTORY_XPATH = etree.XPath('.//Directory')
+_SEARCHRESULT_XPATH = etree.XPath('.//SearchResult')
+
+# Guid schemes of media that is not matched to an agent yet
+_UNMATCHED_GUID_PREFIXES = ("plex://", "local://")
+
+# Seconds the cached server info and timezone stay valid before reconnecting
+SERVER_INFO_TTL = 3600
+
 class PlexClient:
     def __init__(self):
         self.plex_url = os.getenv('PLEX_URL', 'http://localhost:32400')
         self.plex_token = os.getenv('PLEX_TOKEN', '')
+        self._base_url = self.plex_url.rstrip('/')
         self.server_info = None
         self.server_timezone = None
+        self._connected_at = None
+        self._connect_lock = threading.Lock()
         self.session = requests.Session()
         
-    def _make_request(self, endpoint, params=None):
-        """Make authenticated request to Plex API"""
+        # Reuse keep-alive connections and retry transient gateway errors
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'X-Plex-Token': self.plex_token,
+            'Accept-Encoding': 'gzip'
+        })
+        
+    def _get(self, endpoint, params=None, stream=False):
+        """Send authenticated GET request to Plex API and return the response"""
         if not self.plex_token:
             raise Exception("PLEX_TOKEN environment variable is required")
             
-        url = urljoin(self.plex_url, endpoint)
-        headers = {'X-Plex-Token': self.plex_token}
+        url = self._base_url + endpoint
         
         if params is None:
             params = {}
             
-        response = self.session.get(url, headers=headers, params=params, timeout=30)
+        response = self.session.get(url, params=params, timeout=30, stream=stream)
         response.raise_for_status()
-        return ET.fromstring(response.content)
+        return response
+        
+    def _make_request(self, endpoint, params=None):
+        """Make authenticated request to Plex API"""
+        response = self._get(endpoint, params=params)
+        parser = etree.XMLParser(huge_tree=True, recover=False)
+        return etree.XML(response.content, parser=parser)
         
     def connect(self):
         """Connect to Plex server and cache timezone info"""
@@ -48,13 +85,13 @@ class PlexClient:
                 prefs_root = self._make_request('/:/prefs')
                 timezone_pref = None
                 
-                for setting in prefs_root.findall('.//Setting'):
+                for setting in _SETTING_XPATH(prefs_root):
                     if setting.get('id') == 'TimezoneName':
                         timezone_pref = setting.get('value')
                         break
                 
                 if timezone_pref:
-                    self.server_timezone = pytz.timezone(timezone_pref)
+                    self.server_timezone = get_tz(timezone_pref)
                 else:
                     # Fallback to UTC if timezone not found
                     self.server_timezone = TZ
@@ -64,47 +101,58 @@ class PlexClient:
                 logger.warning(f"Could not get server timezone: {e}, using {TZ.zone}")
                 self.server_timezone = TZ
             
+            self._connected_at = time.monotonic()
             logger.info(f"Connected to Plex server: {self.server_info['friendlyName']}")
             logger.info(f"Server timezone: {self.server_timezone}")
             return True
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to connect to Plex server: {e}")
+            self.server_info = None
             return False
         except Exception as e:
             logger.error(f"Failed to connect to Plex server: {e}")
+            self.server_info = None
             return False
     
+    def ensure_connected(self):
+        """Connect to Plex server unless cached server info is still fresh"""
+        with self._connect_lock:
+            if self.server_info and time.monotonic() - self._connected_at < SERVER_INFO_TTL:
+                return True
+            return self.connect()
+    
+    def fetch_libraries(self):
+        """Get all libraries from Plex server, raising on request errors"""
+        root = self._make_request('/library/sections')
+        libraries = []
+        
+        for directory in _DIRECTORY_XPATH(root):
+            libraries.append({
+                'key': directory.get('key'),
+                'title': directory.get('title'),
+                'type': directory.get('type'),
+                'agent': directory.get('agent', 'Unknown')
+            })
+        
+        logger.info(f"Found {len(libraries)} libraries")
+        return libraries
+    
     def get_libraries(self):
         """Get all libraries from Plex server"""
-        if not self.server_info:
-            if not self.connect():
-                return []
+        if not self.ensure_connected():
+            return []
         
         try:
-            root = self._make_request('/library/sections')
-            libraries = []
-            
-            for directory in root.findall('.//Directory'):
-                libraries.append({
-                    'key': directory.get('key'),
-                    'title': directory.get('title'),
-                    'type': directory.get('type'),
-                    'agent': directory.get('agent', 'Unknown')
-                })
-            
-            logger.info(f"Found {len(libraries)} libraries")
-            return libraries
-            
+            return self.fetch_libraries()
         except Exception as e:
             logger.error(f"Failed to get libraries: {e}")
             return []
     
     def get_recent_media(self, library_key, hours=24):
         """Get media added within the specified hours for a library"""
-        if not self.server_info:
-            if not self.connect():
-                return []
+        if not self.ensure_connected():
+            return []
         
         try:
             # Calculate cutoff time in server timezone
@@ -112,48 +160,84 @@ class PlexClient:
             cutoff_time = now_server - timedelta(hours=hours)
             cutoff_timestamp = int(cutoff_time.timestamp())
             
-            # Get all media from library
-            root = self._make_request(f'/library/sections/{library_key}/all')
             recent_media = []
+            library_title = f'Library {library_key}'
+            server_timezone = self.server_timezone
             
-            library_title = root.get('title1', f'Library {library_key}')
-            
-            # Process all media items
-            for item in root.findall('.//Video') + root.findall('.//Track') + root.findall('.//Photo'):
-                added_at_str = item.get('addedAt')
-                if added_at_str:
-                    try:
-                        added_at_timestamp = int(added_at_str)
-                        added_at_dt = datetime.fromtimestamp(added_at_timestamp)
+            # Page through the library newest first and stop once past the cutoff
+            container_start = 0
+            reached_cutoff = False
+            while not reached_cutoff:
+                params = {
+                    'sort': 'addedAt:desc',
+                    'X-Plex-Container-Start': container_start,
+                    'X-Plex-Container-Size': CONTAINER_SIZE
+                }
+                page_size = 0
+                
+                # Stream the page instead of building the whole document
+                with self._get(f'/library/sections/{library_key}/all', params=params, stream=True) as response:
+                    response.raw.decode_content = True
+                    events = etree.iterparse(
+                        response.raw,
+                        events=('start', 'end'),
+                        tag=('MediaContainer', 'Video', 'Track', 'Photo'),
+                        huge_tree=True
+                    )
+                    
+                    for event, item in events:
+                        if item.tag == 'MediaContainer':
+                            if event == 'start':
+                                library_title = item.get('title1', library_title)
+                                page_size = int(item.get('size', 0))
+                            continue
+                        if event != 'end':
+                            continue
+                        
+                        added_at_str = item.get('addedAt')
+                        if added_at_str:
+                            try:
+                                added_at_timestamp = int(added_at_str)
+                                
+                                # If addedAt is within our window, build datetimes only for kept items
+                                if added_at_timestamp >= cutoff_timestamp:
+                                    added_at_dt = datetime.fromtimestamp(added_at_timestamp)
+                                    # Convert to server timezone for display
+                                    added_at_server = datetime.fromtimestamp(added_at_timestamp, tz=server_timezone)
+                                    
+                                    summary = item.get('summary', '')
+                                    if summary and len(summary) > 200:
+                                        summary = summary[:200] + '...'
+                                    
+                                    media_info = {
+                                        'key': item.get('key'),
+                                        'title': item.get('title'),
+                                        'guid': item.get('guid', ''),
+                                        'type': item.get('type'),
+                                        'addedAt': added_at_dt,
+                                        'addedAt_server': added_at_server,
+                                        'year': item.get('year'),
+                                        'summary': summary
+                                    }
+                                    recent_media.append(media_info)
+                                else:
+                                    # Items are sorted newest first, the rest is older
+                                    reached_cutoff = True
+                            except (ValueError, TypeError) as e:
+                                logger.warning(f"Could not parse addedAt timestamp {added_at_str}: {e}")
+                        
+                        # Free already processed elements to keep memory flat
+                        item.clear()
+                        while item.getprevious() is not None:
+                            del item.getparent()[0]
                         
-                        # If addedAt is within our window
-                        if added_at_timestamp >= cutoff_timestamp:
-                            # Convert to server timezone for display
-                            if added_at_dt.tzinfo is None:
-                                added_at_server = self.server_timezone.localize(added_at_dt)
-                            else:
-                                added_at_server = added_at_dt.astimezone(self.server_timezone)
-                            
-                            summary = item.get('summary', '')
-                            if summary and len(summary) > 200:
-                                summary = summary[:200] + '...'
-                            
-                            media_info = {
-                                'key': item.get('key'),
-                                'title': item.get('title'),
-                                'type': item.get('type'),
-                                'addedAt': added_at_dt,
-                                'addedAt_server': added_at_server,
-                                'year': item.get('year'),
-                                'summary': summary
-                            }
-                            recent_media.append(media_info)
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"Could not parse addedAt timestamp {added_at_str}: {e}")
-                        continue
+                        if reached_cutoff:
+                            break
+                
+                if page_size < CONTAINER_SIZE:
+                    break
+                container_start += CONTAINER_SIZE
             
-            # Sort by addedAt descending
-            recent_media.sort(key=lambda x: x['addedAt'], reverse=True)
             logger.info(f"Found {len(recent_media)} recent media items in library {library_title}")
             return recent_media
             
@@ -168,43 +252,19 @@ class PlexClient:
             return []
     
     
-    def match_with_agent(self, library_key, media_key, agent_name):
+    def match_with_agent(self, library_key, media_key, agent_name, media_title="Unknown", media_guid=None):
         """Attempt to match media with specified agent - refresh if matched, match first available if unmatched"""
-        if not self.server_info:
-            if not self.connect():
-                return False, "Not connected to Plex server"
+        if not self.ensure_connected():
+            return False, "Not connected to Plex server"
         
         try:
-            # Get media info first
-            media_root = self._make_request(f'{media_key}')
-            media_title = "Unknown"
-            media_guid = None
-            
-            for item in media_root.findall('.//Video') + media_root.findall('.//Track') + media_root.findall('.//Photo'):
-                if item.get('key') == media_key:
-                    media_title = item.get('title', 'Unknown')
-                    media_guid = item.get('guid', '')
-                    break
-            
-
-            def is_guid_matched(media_guid: str) -> bool:
-                if not media_guid:
-                    return False
-                # Unmatched cases
-                if media_guid.startswith("plex://") or media_guid.startswith("local://"):
-                    return False
-                # Otherwise assume matched (imdb://, tmdb://, tvdb://, etc.)
-                return True
-            
-            # Check if media is already matched (has a meaningful guid)
-            is_matched = is_guid_matched(media_guid)
+            # Check if media is already matched (imdb://, tmdb://, tvdb://, etc.)
+            is_matched = bool(media_guid) and not media_guid.startswith(_UNMATCHED_GUID_PREFIXES)
             
             if is_matched:
                 # Media is already matched, just refresh it
-                url = urljoin(self.plex_url, f'{media_key}/refresh')
-                headers = {'X-Plex-Token': self.plex_token}
-                
-                response = self.session.put(url, headers=headers, timeout=30)
+                url = f'{self._base_url}{media_key}/refresh'
+                response = self.session.put(url, timeout=30)
                 response.raise_for_status()
                 
                 logger.info(f"Refreshed already matched media: {media_title} (guid: {media_guid})")
@@ -214,7 +274,7 @@ class PlexClient:
                 # Media is unmatched, try to find and apply first available match
                 try:
                     matches_root = self._make_request(f'{media_key}/matches')
-                    matches = matches_root.findall('.//SearchResult')
+                    matches = _SEARCHRESULT_XPATH(matches_root)
                     
                     if not matches:
                         logger.info(f"No matches found for unmatched media: {media_title}")
@@ -227,11 +287,10 @@ class PlexClient:
                     
                     if match_guid:
                         # Apply the first match
-                        url = urljoin(self.plex_url, f'{media_key}/match')
-                        headers = {'X-Plex-Token': self.plex_token}
+                        url = f'{self._base_url}{media_key}/match'
                         params = {'guid': match_guid}
                         
-                        response = self.session.put(url, headers=headers, params=params, timeout=30)
+                        response = self.session.put(url, params=params, timeout=30)
                         response.raise_for_status()
                         
                         logger.info(f"Matched unmatched media: {media_title} → {match_name} ({match_guid})")
@@ -259,21 +318,15 @@ class PlexClient:
             error_msg = f"Failed to process media {media_key} with agent {agent_name}: {e}"
             logger.error(error_msg)
             return False, error_msg
-    
-    def validate_library_config(self, library_key):
-        """Validate if a library configuration is valid"""
-        if not self.server_info:
-            if not self.connect():
-                return False, "Unable to connect to Plex server"
-        
-        try:
-            root = self._make_request(f'/library/sections/{library_key}')
-            library_title = root.get('title1', f'Library {library_key}')
-            return True, f"Library '{library_title}' is valid"
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
-                return False, f"Library with ID {library_key} not found on Plex server"
-            else:
-                return False, f"HTTP error validating library {library_key}: {e}"
-        except Exception as e:
-            return False, f"Error validating library {library_key}: {e}"
+
+
+_plex_client = None
+_plex_client_lock = threading.Lock()
+
+def get_plex_client():
+    """Return the process-wide PlexClient, creating it on first use"""
+    global _plex_client
+    with _plex_client_lock:
+        if _plex_client is None:
+            _plex_client = PlexClient()
+        return _plex_client
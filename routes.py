@@ -1,11 +1,13 @@
 import logging
+import requests
 from datetime import datetime
 from flask import render_template, request, redirect, url_for, flash, jsonify
+from sqlalchemy import case, func, tuple_
 from app import app, db
 from models import LibraryConfig, MediaItem, ScanLog
-from plex_client import PlexClient
+from plex_client import get_plex_client
 from config import TZ
-from scheduler import scheduler_next_run
+from scheduler import scheduler_next_run, trigger_scan
 
 logger = logging.getLogger(__name__)
 
@@ -15,16 +17,34 @@ def index():
     configs = LibraryConfig.query.all()
     recent_scan = ScanLog.query.order_by(ScanLog.scan_started_at.desc()).first()
     
-    # Get recent media for each library
+    # Count processed media per library in a single aggregate query
+    media_counts = dict(
+        db.session.query(MediaItem.library_config_id, func.count(MediaItem.id))
+                  .group_by(MediaItem.library_config_id)
+                  .all()
+    )
+    
+    # Fetch the 10 most recently processed media for every library at once
+    row_number = func.row_number().over(
+        partition_by=MediaItem.library_config_id,
+        order_by=(MediaItem.processed_at.desc(), MediaItem.id.desc())
+    ).label('rn')
+    ranked = db.session.query(MediaItem.id.label('id'), row_number).subquery()
+    recent_items = MediaItem.query.join(ranked, MediaItem.id == ranked.c.id)\
+                                  .filter(ranked.c.rn <= 10)\
+                                  .order_by(MediaItem.processed_at.desc(), MediaItem.id.desc())\
+                                  .all()
+    
+    recent_by_config = {}
+    for media in recent_items:
+        recent_by_config.setdefault(media.library_config_id, []).append(media)
+    
     library_stats = []
     for config in configs:
-        recent_media = MediaItem.query.filter_by(library_config_id=config.id)\
-                                     .order_by(MediaItem.processed_at.desc())\
-                                     .limit(10).all()
         library_stats.append({
             'config': config,
-            'recent_media': recent_media,
-            'total_media': MediaItem.query.filter_by(library_config_id=config.id).count()
+            'recent_media': recent_by_config.get(config.id, []),
+            'total_media': media_counts.get(config.id, 0)
         })
     
     return render_template('index.html', 
@@ -43,8 +63,8 @@ def add_config():
     """Add new library configuration"""
     if request.method == 'GET':
         # Get available libraries from Plex
-        plex_client = PlexClient()
-        if not plex_client.connect():
+        plex_client = get_plex_client()
+        if not plex_client.ensure_connected():
             flash('Failed to connect to Plex server. Please check your PLEX_URL and PLEX_TOKEN environment variables.', 'danger')
             return redirect(url_for('config'))
         
@@ -144,29 +164,57 @@ def library_detail(config_id):
     """Detailed view of a specific library"""
     config = LibraryConfig.query.get_or_404(config_id)
     
-    # Get recent media for this library
-    page = request.args.get('page', 1, type=int)
+    # Aggregate statistics for the whole library
+    total_media, matched_media = db.session.query(
+        func.count(MediaItem.id),
+        func.coalesce(func.sum(case((MediaItem.match_successful.is_(True), 1), else_=0)), 0)
+    ).filter(MediaItem.library_config_id == config_id).one()
+    
+    # Get recent media for this library using keyset pagination
     per_page = 20
+    query = MediaItem.query.filter(MediaItem.library_config_id == config_id)
+    
+    after = request.args.get('after')
+    after_id = request.args.get('after_id', type=int)
+    is_first_page = True
+    if after and after_id is not None:
+        try:
+            after_ts = datetime.fromisoformat(after)
+            query = query.filter(tuple_(MediaItem.processed_at, MediaItem.id) < (after_ts, after_id))
+            is_first_page = False
+        except ValueError:
+            logger.warning(f"Ignoring invalid pagination cursor: {after}")
+    
+    # One extra row tells whether another page follows
+    media_items = query.order_by(MediaItem.processed_at.desc(), MediaItem.id.desc())\
+                       .limit(per_page + 1).all()
+    has_next = len(media_items) > per_page
+    media_items = media_items[:per_page]
     
-    media_items = MediaItem.query.filter_by(library_config_id=config_id)\
-                                .order_by(MediaItem.processed_at.desc())\
-                                .paginate(page=page, per_page=per_page, error_out=False)
+    next_cursor = None
+    if has_next:
+        last_item = media_items[-1]
+        next_cursor = {'after': last_item.processed_at.isoformat(), 'after_id': last_item.id}
     
-    return render_template('library_detail.html', config=config, media_items=media_items, scheduler_next_run=scheduler_next_run())
+    return render_template('library_detail.html',
+                         config=config,
+                         media_items=media_items,
+                         total_media=total_media,
+                         matched_media=matched_media,
+                         is_first_page=is_first_page,
+                         next_cursor=next_cursor,
+                         scheduler_next_run=scheduler_next_run())
 
 
 @app.route('/scan/manual')
 def manual_scan():
     """Trigger a manual scan"""
-    from scheduler import scan_libraries
-    
     try:
-        # Run scan in background
-        import threading
-        thread = threading.Thread(target=scan_libraries)
-        thread.start()
-        
-        flash('Manual scan started. Check back in a few minutes for results.', 'info')
+        # Run scan in background through the scheduler so scans never overlap
+        if trigger_scan():
+            flash('Manual scan started. Check back in a few minutes for results.', 'info')
+        else:
+            flash('A scan is already running. Check back in a few minutes for results.', 'warning')
     except Exception as e:
         logger.error(f"Error starting manual scan: {e}")
         flash('Error starting manual scan. Please try again.', 'danger')
@@ -187,9 +235,9 @@ def scan_logs():
 @app.route('/debug/libraries')
 def debug_libraries():
     """Debug endpoint to show available Plex libraries"""
-    plex_client = PlexClient()
+    plex_client = get_plex_client()
     
-    if not plex_client.connect():
+    if not plex_client.ensure_connected():
         return jsonify({
             "error": "Failed to connect to Plex server",
             "plex_url": plex_client.plex_url,
@@ -209,15 +257,32 @@ def debug_libraries():
 def validate_configs():
     """Validate all library configurations"""
     configs = LibraryConfig.query.all()
-    plex_client = PlexClient()
+    plex_client = get_plex_client()
     
-    if not plex_client.connect():
+    if not plex_client.ensure_connected():
         flash('Failed to connect to Plex server. Please check your PLEX_URL and PLEX_TOKEN.', 'danger')
         return redirect(url_for('config'))
     
+    # Fetch libraries once and validate all configurations locally
+    try:
+        libraries = {library['key']: library for library in plex_client.fetch_libraries()}
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"HTTP error validating libraries: {e}")
+        flash(f'HTTP error validating libraries: {e}', 'danger')
+        return redirect(url_for('config'))
+    except Exception as e:
+        logger.error(f"Error validating libraries: {e}")
+        flash(f'Error validating libraries: {e}', 'danger')
+        return redirect(url_for('config'))
+    
     validation_results = []
     for config in configs:
-        is_valid, message = plex_client.validate_library_config(config.library_key)
+        library = libraries.get(config.library_key)
+        is_valid = library is not None
+        if is_valid:
+            message = f"Library '{library['title']}' is valid"
+        else:
+            message = f"Library with ID {config.library_key} not found on Plex server"
         validation_results.append({
             'config': config,
             'is_valid': is_valid,
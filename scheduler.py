@@ -1,17 +1,131 @@
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from app import app, db
 from models import LibraryConfig, MediaItem, ScanLog
-from plex_client import PlexClient
+from plex_client import get_plex_client
 from config import TZ
 import os
 
 logger = logging.getLogger(__name__)
 
+# Upper bounds for concurrent library scans and concurrent agent matches per library
+MAX_LIBRARY_WORKERS = 8
+MAX_MATCH_WORKERS = 4
+
+def _scan_library(plex_client, config_id):
+    """Scan a single library and record its newly added media"""
+    with app.app_context():
+        config = db.session.get(LibraryConfig, config_id)
+        library_key = config.library_key
+        agent_name = config.agent_name
+        
+        media_found = 0
+        matched = 0
+        errors = 0
+        
+        try:
+            logger.info(f"Scanning library: {config.library_name}")
+            
+            # Get recent media from this library
+            recent_media = plex_client.get_recent_media(library_key, hours=24)
+            media_found = len(recent_media)
+            
+            # Load keys of already processed media in a single query
+            existing_keys = set()
+            if recent_media:
+                existing_keys = set(
+                    row[0] for row in db.session.query(MediaItem.plex_key).filter(
+                        MediaItem.library_config_id == config_id,
+                        MediaItem.plex_key.in_([m['key'] for m in recent_media])
+                    ).all()
+                )
+            
+            pending_media = []
+            for media in recent_media:
+                # Check if we've already processed this media
+                if media['key'] in existing_keys:
+                    logger.debug(f"Media {media['title']} already processed")
+                    continue
+                existing_keys.add(media['key'])
+                pending_media.append(media)
+            
+            # Matches are independent requests, so issue them concurrently
+            with ThreadPoolExecutor(max_workers=MAX_MATCH_WORKERS) as executor:
+                futures = [
+                    executor.submit(
+                        plex_client.match_with_agent,
+                        library_key,
+                        media['key'],
+                        agent_name,
+                        media['title'],
+                        media['guid']
+                    )
+                    for media in pending_media
+                ]
+            
+            # Stamp the whole batch once instead of running the column default per row
+            processed_at = datetime.now(tz=TZ)
+            rows = []
+            for media, future in zip(pending_media, futures):
+                try:
+                    # Result of the attempt to match with configured agent
+                    success, message = future.result()
+                    
+                    # Build new media item row
+                    rows.append({
+                        'library_config_id': config_id,
+                        'plex_key': media['key'],
+                        'title': media['title'],
+                        'media_type': media['type'],
+                        'added_at': media['addedAt'],
+                        'processed_at': processed_at,
+                        'agent_matched': agent_name,
+                        'match_successful': success,
+                        'error_message': None if success else message
+                    })
+                    if not success:
+                        errors += 1
+                    else:
+                        matched += 1
+                    
+                    logger.info(f"Processed media: {media['title']} - Success: {success}")
+                    
+                except Exception as e:
+                    logger.error(f"Error processing media {media.get('title', 'Unknown')}: {e}")
+                    errors += 1
+            
+            # Persist all processed media of this library at once
+            if rows:
+                db.session.bulk_insert_mappings(MediaItem, rows)
+                db.session.commit()
+        
+        except Exception as e:
+            logger.error(f"Error scanning library {config.library_name}: {e}")
+            db.session.rollback()
+            errors += 1
+        
+        return media_found, matched, errors
+
+# Held while a scan runs so manual triggers can tell a scan is in progress
+_scan_lock = threading.Lock()
+
 def scan_libraries():
     """Periodic task to scan all configured libraries"""
+    if not _scan_lock.acquire(blocking=False):
+        logger.info("Library scan already in progress, skipping")
+        return
+    
+    try:
+        _run_scan()
+    finally:
+        _scan_lock.release()
+
+def _run_scan():
+    """Scan all enabled libraries and record the results in a scan log"""
     with app.app_context():
         logger.info("Starting periodic library scan")
         
@@ -20,8 +134,8 @@ def scan_libraries():
         db.session.commit()
         
         try:
-            plex_client = PlexClient()
-            if not plex_client.connect():
+            plex_client = get_plex_client()
+            if not plex_client.ensure_connected():
                 scan_log.status = 'failed'
                 scan_log.error_message = 'Failed to connect to Plex server'
                 scan_log.scan_completed_at = datetime.now(tz=TZ)
@@ -31,65 +145,21 @@ def scan_libraries():
             # Get all enabled library configurations
             configs = LibraryConfig.query.filter_by(enabled=True).all()
             scan_log.total_libraries = len(configs)
+            db.session.commit()
             
             total_media_found = 0
             total_matched = 0
             total_errors = 0
             
-            for config in configs:
-                try:
-                    logger.info(f"Scanning library: {config.library_name}")
-                    
-                    # Get recent media from this library
-                    recent_media = plex_client.get_recent_media(config.library_key, hours=24)
-                    total_media_found += len(recent_media)
-                    
-                    for media in recent_media:
-                        try:
-                            # Check if we've already processed this media
-                            existing = MediaItem.query.filter_by(
-                                library_config_id=config.id,
-                                plex_key=media['key']
-                            ).first()
-                            
-                            if existing:
-                                logger.debug(f"Media {media['title']} already processed")
-                                continue
-                            
-                            # Create new media item record
-                            media_item = MediaItem(
-                                library_config_id=config.id,
-                                plex_key=media['key'],
-                                title=media['title'],
-                                media_type=media['type'],
-                                added_at=media['addedAt']
-                            )
-                            
-                            # Attempt to match with configured agent
-                            success, message = plex_client.match_with_agent(
-                                config.library_key,
-                                media['key'],
-                                config.agent_name
-                            )
-                            
-                            media_item.agent_matched = config.agent_name
-                            media_item.match_successful = success
-                            if not success:
-                                media_item.error_message = message
-                                total_errors += 1
-                            else:
-                                total_matched += 1
-                            
-                            db.session.add(media_item)
-                            logger.info(f"Processed media: {media['title']} - Success: {success}")
-                            
-                        except Exception as e:
-                            logger.error(f"Error processing media {media.get('title', 'Unknown')}: {e}")
-                            total_errors += 1
-                
-                except Exception as e:
-                    logger.error(f"Error scanning library {config.library_name}: {e}")
-                    total_errors += 1
+            # Libraries are scanned in parallel, each worker uses its own session
+            if configs:
+                with ThreadPoolExecutor(max_workers=min(MAX_LIBRARY_WORKERS, len(configs))) as executor:
+                    futures = [executor.submit(_scan_library, plex_client, config.id) for config in configs]
+                    for future in as_completed(futures):
+                        media_found, matched, errors = future.result()
+                        total_media_found += media_found
+                        total_matched += matched
+                        total_errors += errors
             
             # Update scan log
             scan_log.total_media_found = total_media_found
@@ -126,7 +196,9 @@ def init_scheduler(app):
         trigger=trigger,
         id='library_scan',
         name='Scan Plex libraries for new media',
-        replace_existing=True
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
     )
 
     # Initial scan
@@ -142,6 +214,20 @@ def init_scheduler(app):
     atexit.register(lambda: scheduler.shutdown())
 
 
+def trigger_scan():
+    """Run the library scan job now, returns False if a scan is already running or queued"""
+    job = scheduler.get_job("library_scan")
+    if job is None:
+        raise RuntimeError("Library scan job is not scheduled")
+    
+    now = datetime.now(tz=TZ)
+    if _scan_lock.locked() or (job.next_run_time and job.next_run_time <= now):
+        return False
+    
+    job.modify(next_run_time=now)
+    return True
+
+
 def scheduler_next_run():
     job = scheduler.get_job("library_scan")
     if job and job.next_run_time: